@@ -1,98 +1,555 @@
 import streamlit as st
 from agno.agent import Agent
-from agno.run.agent import RunOutput
+from agno.run.team import TeamRunEvent, TeamRunOutput
 from agno.team import Team
 from agno.knowledge.knowledge import Knowledge
+from agno.knowledge.reader.pdf_reader import PDFReader
 from agno.vectordb.qdrant import Qdrant
 from agno.tools.duckduckgo import DuckDuckGoTools
 from agno.models.openai import OpenAIChat
 from agno.knowledge.embedder.openai import OpenAIEmbedder
-import tempfile
+from qdrant_client.http import models
+from pypdf import PdfReader, PdfWriter
+import httpx
+import io
 import os
+import json
+import copy
+import asyncio
+import hashlib
+import importlib.util
+import math
+import tempfile
+import threading
+from dataclasses import dataclass
+
+# Verbose agno logging is opt-in: LEGAL_AGENT_DEBUG=1
+DEBUG = os.getenv("LEGAL_AGENT_DEBUG") == "1"
 
 # Define default Base URL
 DEFAULT_BASE_URL = "https://api.zhizengzeng.com/v1"
+# Non-secret settings survive browser refreshes here; API keys and file names are never written to it.
+# The file is shared by every session of this server process.
+PERSISTED_STATE_PATH = os.path.expanduser("~/.legal_agent_cache.json")
+
+def load_persisted_state() -> dict:
+    """Load the non-secret settings saved by a previous session."""
+    try:
+        with open(PERSISTED_STATE_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def persist_state():
+    """
+    Save the non-secret settings to disk, writing only when they changed since the last save.
+    Only content hashes of stored documents are saved, merged with those other sessions saved for the same scope.
+    """
+    state = {
+        "openai_base_url": st.session_state.openai_base_url,
+        "qdrant_url": st.session_state.qdrant_url,
+        "processed_hashes": {
+            scope: sorted(files) for scope, files in st.session_state.processed_files.items() if files
+        }
+    }
+    if state == st.session_state.persisted_state:
+        return
+    merged_hashes = load_persisted_state().get("processed_hashes", {})
+    for scope, hashes in state["processed_hashes"].items():
+        merged_hashes[scope] = sorted(set(merged_hashes.get(scope, [])) | set(hashes))
+    try:
+        # A unique temp file per write, so concurrent sessions don't clobber each other's partial writes
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(PERSISTED_STATE_PATH), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({**state, "processed_hashes": merged_hashes}, f)
+        os.replace(tmp_path, PERSISTED_STATE_PATH)
+        st.session_state.persisted_state = copy.deepcopy(state)
+    except OSError:
+        pass
+
+def get_secret(name: str):
+    """Read an optional API key from st.secrets, returning None when no secrets are configured."""
+    try:
+        return st.secrets.get(name)
+    except Exception:
+        return None
+
+def current_processed_files() -> dict:
+    """
+    Processed files stored in the current Qdrant cluster and collection.
+    Hashes recorded against another URL or embedding backend say nothing about this one.
+    """
+    scope = f"{st.session_state.qdrant_url}|{COLLECTION_NAME}"
+    return st.session_state.processed_files.setdefault(scope, {})
+
+def is_processed(doc_hash: str) -> bool:
+    """
+    Whether this session stored the document in the current scope.
+    Hashes restored from disk (file name None) are only hints and still have to be confirmed with document_exists.
+    """
+    return current_processed_files().get(doc_hash) is not None
 
 def init_session_state():
     """Initialize session state variables"""
+    # Read the saved settings once per browser session
+    if 'persisted_state' not in st.session_state:
+        st.session_state.persisted_state = load_persisted_state()
+    persisted = st.session_state.persisted_state
     if 'openai_api_key' not in st.session_state:
-        st.session_state.openai_api_key = None
+        st.session_state.openai_api_key = get_secret("OPENAI_API_KEY")
+    # The saved URLs may come from any session, so a server-side key is never pointed at one of them
     if 'openai_base_url' not in st.session_state:
-        st.session_state.openai_base_url = DEFAULT_BASE_URL
+        saved_base_url = None if get_secret("OPENAI_API_KEY") else persisted.get("openai_base_url")
+        st.session_state.openai_base_url = saved_base_url or DEFAULT_BASE_URL
     if 'qdrant_api_key' not in st.session_state:
-        st.session_state.qdrant_api_key = None
+        st.session_state.qdrant_api_key = get_secret("QDRANT_API_KEY")
     if 'qdrant_url' not in st.session_state:
-        st.session_state.qdrant_url = None
+        st.session_state.qdrant_url = get_secret("QDRANT_URL") if get_secret("QDRANT_API_KEY") else persisted.get("qdrant_url")
     if 'vector_db' not in st.session_state:
         st.session_state.vector_db = None
     if 'legal_team' not in st.session_state:
         st.session_state.legal_team = None
     if 'knowledge_base' not in st.session_state:
         st.session_state.knowledge_base = None
-    # Add a new state variable to track processed files
+    # Track processed files per storage scope as content hash -> file name (None when restored from disk)
     if 'processed_files' not in st.session_state:
-        st.session_state.processed_files = set()
+        st.session_state.processed_files = {
+            scope: dict.fromkeys(hashes) for scope, hashes in persisted.get("processed_hashes", {}).items()
+        }
+    # Content hash of each upload, keyed by its UploadedFile.file_id
+    if 'file_hashes' not in st.session_state:
+        st.session_state.file_hashes = {}
+    # Cache of finished analyses keyed by (content hash, analysis type, normalized query)
+    if 'analysis_cache' not in st.session_state:
+        st.session_state.analysis_cache = {}
+    # Credentials the current vector_db was built with
+    if 'last_qdrant_creds' not in st.session_state:
+        st.session_state.last_qdrant_creds = None
+
+# "openai" embeds extracted text chunks; "gemini-native" embeds raw PDF page groups with Gemini
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai")
+GEMINI_EMBEDDING_MODEL = os.getenv("GEMINI_EMBEDDING_MODEL", "gemini-embedding-2-preview")
+# Maximum pages per natively embedded PDF group
+PDF_PAGES_PER_EMBEDDING = 6
+# Define your collection name; vectors are 512-dim, so this cannot reuse a 1536-dim collection.
+# The two backends produce vectors in different spaces, so each gets its own collection.
+COLLECTION_NAME = "legal_documents_gemini_512" if EMBEDDING_BACKEND == "gemini-native" else "legal_documents_512"
+# Matryoshka-truncated text-embedding-3-small output size
+EMBEDDING_DIMENSIONS = 512
+# Chunks embedded per OpenAI request; kept well under the per-request token limit for 5k-char chunks
+EMBEDDING_BATCH_SIZE = 100
+# Maximum number of embedding batches in flight at once
+EMBEDDING_CONCURRENCY = 16
+# Chunks per Qdrant upsert in the Ray Data ingestion pipeline
+RAY_UPSERT_BATCH_SIZE = 512
+# Minimum cosine similarity for a custom query to reuse a cached analysis
+SEMANTIC_CACHE_THRESHOLD = 0.95
 
-COLLECTION_NAME = "legal_documents"  # Define your collection name
+# Icons for each analysis type
+ANALYSIS_ICONS = {
+    "Contract Review": "📑",
+    "Legal Research": "🔍",
+    "Risk Assessment": "⚠️",
+    "Compliance Check": "✅",
+    "Custom Query": "💭"
+}
+
+# Prompt templates, filled with str.format; unused placeholders are ignored
+ANALYSIS_PROMPT_TEMPLATE = """
+Using the uploaded document as reference:
+
+Primary Analysis Task: {query}
+Focus Areas: {agents}
+
+Please search the knowledge base and provide specific citations from the document.
+"""
+
+CUSTOM_QUERY_PROMPT_TEMPLATE = """
+Using the uploaded document as reference:
+
+{user_query}
+
+Please search the knowledge base and provide specific citations from the document.
+Focus Areas: {agents}
+"""
+
+# Static per-analysis-type settings
+ANALYSIS_CONFIGS = {
+    "Contract Review": {
+        "query": "Review this contract and identify key terms, obligations, and potential issues.",
+        "agents": ["Contract Analyst"],
+        "description": "Detailed contract analysis focusing on terms and obligations",
+        "prompt_template": ANALYSIS_PROMPT_TEMPLATE
+    },
+    "Legal Research": {
+        "query": "Research cases and precedents relevant to this document.",
+        "agents": ["Legal Researcher"],
+        "description": "Research on relevant legal cases and precedents",
+        "prompt_template": ANALYSIS_PROMPT_TEMPLATE
+    },
+    "Risk Assessment": {
+        "query": "Analyze potential legal risks and liabilities in this document.",
+        "agents": ["Contract Analyst", "Legal Strategist"],
+        "description": "Comprehensive risk analysis and strategic assessment",
+        "prompt_template": ANALYSIS_PROMPT_TEMPLATE
+    },
+    "Compliance Check": {
+        "query": "Check for regulatory compliance issues in this document.",
+        "agents": ["Legal Researcher", "Contract Analyst", "Legal Strategist"],
+        "description": "Comprehensive compliance analysis",
+        "prompt_template": ANALYSIS_PROMPT_TEMPLATE
+    },
+    "Custom Query": {
+        "query": None,
+        "agents": ["Legal Researcher", "Contract Analyst", "Legal Strategist"],
+        "description": "Custom analysis using all available agents",
+        "prompt_template": CUSTOM_QUERY_PROMPT_TEMPLATE
+    }
+}
+
+@dataclass
+class ConcurrentOpenAIEmbedder(OpenAIEmbedder):
+    """OpenAIEmbedder that sends its embedding batches concurrently instead of one after another."""
+    max_concurrency: int = EMBEDDING_CONCURRENCY
+
+    async def async_get_embeddings_batch_and_usage(self, texts):
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def embed_batch(batch_texts):
+            async with semaphore:
+                # The parent handles a single batch, including its per-text fallback on errors
+                return await OpenAIEmbedder.async_get_embeddings_batch_and_usage(self, batch_texts)
+
+        results = await asyncio.gather(
+            *[embed_batch(texts[i:i + self.batch_size]) for i in range(0, len(texts), self.batch_size)]
+        )
+
+        all_embeddings, all_usage = [], []
+        for batch_embeddings, batch_usage in results:
+            all_embeddings.extend(batch_embeddings)
+            all_usage.extend(batch_usage)
+        return all_embeddings, all_usage
+
+@st.cache_resource
+def get_vector_db(qdrant_url, qdrant_api_key, openai_api_key, openai_base_url):
+    """Create the Qdrant vector DB once per credential set and reuse it across reruns."""
+    if EMBEDDING_BACKEND == "gemini-native":
+        # Queries must be embedded into the same space as the natively embedded PDF pages
+        from agno.knowledge.embedder.google import GeminiEmbedder  # Optional: pip install google-genai
+        embedder = GeminiEmbedder(
+            id=GEMINI_EMBEDDING_MODEL,
+            dimensions=EMBEDDING_DIMENSIONS,
+            api_key=get_secret("GOOGLE_API_KEY") # Falls back to the GOOGLE_API_KEY environment variable
+        )
+    else:
+        embedder = ConcurrentOpenAIEmbedder(
+            id="text-embedding-3-small", 
+            dimensions=EMBEDDING_DIMENSIONS,
+            api_key=openai_api_key,
+            base_url=openai_base_url, # Use dynamically configured Base URL
+            # Embed chunks in batched requests; agno then writes all points in a single Qdrant upsert
+            enable_batch=True,
+            batch_size=EMBEDDING_BATCH_SIZE
+        )
+
+    # Create Agno's Qdrant instance which implements VectorDb
+    vector_db = Qdrant(
+        collection=COLLECTION_NAME,
+        url=qdrant_url,
+        api_key=qdrant_api_key,
+        embedder=embedder
+    )
+
+    # Create the collection ourselves so it gets int8 scalar quantization, which agno's create() doesn't expose
+    if not vector_db.exists():
+        vector_db.client.create_collection(
+            collection_name=COLLECTION_NAME,
+            vectors_config=models.VectorParams(size=EMBEDDING_DIMENSIONS, distance=models.Distance.COSINE),
+            quantization_config=models.ScalarQuantization(
+                scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, always_ram=True)
+            )
+        )
+    # Index the dedup key so document_exists is a lookup rather than a full scan (strict mode rejects unindexed filters)
+    vector_db.client.create_payload_index(
+        collection_name=COLLECTION_NAME,
+        field_name="meta_data.doc_sha256",
+        field_schema=models.PayloadSchemaType.KEYWORD
+    )
+    return vector_db
 
 def init_qdrant():
     """Initialize Qdrant client with configured settings."""
     if not all([st.session_state.qdrant_api_key, st.session_state.qdrant_url]):
         return None
     try:
-        # Create Agno's Qdrant instance which implements VectorDb
-        vector_db = Qdrant(
-            collection=COLLECTION_NAME,
-            url=st.session_state.qdrant_url,
-            api_key=st.session_state.qdrant_api_key,
-            embedder=OpenAIEmbedder(
-                id="text-embedding-3-small", 
-                api_key=st.session_state.openai_api_key,
-                base_url=st.session_state.openai_base_url # Use dynamically configured Base URL
-            )
+        return get_vector_db(
+            st.session_state.qdrant_url,
+            st.session_state.qdrant_api_key,
+            st.session_state.openai_api_key,
+            st.session_state.openai_base_url
         )
-        return vector_db
     except Exception as e:
         st.error(f"🔴 Qdrant connection failed: {str(e)}")
         return None
 
-def process_document(uploaded_file, vector_db: Qdrant):
+def sync_credentials(openai_key, base_url, qdrant_key, qdrant_url):
+    """
+    Apply the sidebar inputs to session state and reconnect Qdrant only when its credentials change.
+    Returns the vector DB and whether everything needed for document upload is configured.
+    """
+    for state_key, value in (
+        ('openai_api_key', openai_key),
+        ('openai_base_url', base_url),
+        ('qdrant_api_key', qdrant_key),
+        ('qdrant_url', qdrant_url)
+    ):
+        # Empty inputs keep the previous value; unchanged values are not rewritten
+        if value and st.session_state[state_key] != value:
+            st.session_state[state_key] = value
+
+    qdrant_creds = (
+        st.session_state.qdrant_url,
+        st.session_state.qdrant_api_key,
+        st.session_state.openai_api_key,
+        st.session_state.openai_base_url
+    )
+    if all([st.session_state.qdrant_api_key, st.session_state.qdrant_url]) \
+            and qdrant_creds != st.session_state.last_qdrant_creds:
+        st.session_state.vector_db = init_qdrant()
+        if st.session_state.vector_db:
+            st.session_state.last_qdrant_creds = qdrant_creds
+            st.success("Successfully connected to Qdrant!")
+            # An existing team still holds the old OpenAI settings and vector DB, so rebuild it as well
+            if st.session_state.legal_team:
+                st.session_state.knowledge_base = get_knowledge(qdrant_creds, st.session_state.vector_db)
+                st.session_state.legal_team = get_legal_team(qdrant_creds, st.session_state.knowledge_base)
+
+    ready = bool(st.session_state.openai_api_key and st.session_state.vector_db)
+    return st.session_state.vector_db, ready
+
+@st.cache_resource
+def get_knowledge(qdrant_creds, _vector_db):
+    """
+    Build the Knowledge base once per vector DB instead of on every upload.
+    The credential tuple the vector DB was built from serves as the cache key; the vector DB itself is not hashed.
+    """
+    return Knowledge(vector_db=_vector_db)
+
+@st.cache_resource
+def get_http_client():
+    """Shared keep-alive connection pool for the chat models, so LLM calls skip repeated TLS handshakes."""
+    return httpx.Client(limits=httpx.Limits(max_keepalive_connections=20))
+
+@st.cache_resource
+def get_legal_team(qdrant_creds, _knowledge_base):
+    """
+    Build the legal agent team once per credential set and reuse it across reruns.
+    Keyed on the same credential tuple as get_knowledge, so the team always wraps the matching knowledge base.
+    """
+    _, _, openai_api_key, openai_base_url = qdrant_creds
+    # Chat models hold no per-agent state, so all agents and the team lead share one instance
+    shared_model = OpenAIChat(
+        id="gpt-4.1",
+        api_key=openai_api_key,
+        base_url=openai_base_url, # Use configured Base URL
+        http_client=get_http_client()
+    )
+
+    # Initialize agents
+    legal_researcher = Agent(
+        name="Legal Researcher",
+        role="Legal Research Expert",
+        model=shared_model,
+        tools=[DuckDuckGoTools()],
+        knowledge=_knowledge_base,
+        search_knowledge=True,
+        instructions=[
+            "Find and cite relevant legal cases and precedents",
+            "Provide detailed research summaries with sources",
+            "Cite specific sections from the uploaded document",
+            "Always search the knowledge base for relevant information"
+        ],
+        debug_mode=DEBUG,
+        markdown=True
+    )
+
+    contract_analyst = Agent(
+        name="Contract Analyst",
+        role="Contract Analysis Expert",
+        model=shared_model,
+        knowledge=_knowledge_base,
+        search_knowledge=True,
+        instructions=[
+            "Thoroughly review the contract",
+            "Identify key terms and potential issues",
+            "Cite specific clauses from the document"
+        ],
+        markdown=True
+    )
+
+    legal_strategist = Agent(
+        name="Legal Strategist", 
+        role="Legal Strategy Expert",
+        model=shared_model,
+        knowledge=_knowledge_base,
+        search_knowledge=True,
+        instructions=[
+            "Develop comprehensive legal strategies",
+            "Provide actionable recommendations",
+            "Consider both risks and opportunities"
+        ],
+        markdown=True
+    )
+
+    # Legal Agent Team
+    return Team(
+        name="Legal Team Lead",
+        model=shared_model,
+        members=[legal_researcher, contract_analyst, legal_strategist],
+        knowledge=_knowledge_base,
+        search_knowledge=True,
+        instructions=[
+            "Coordinate analysis among team members",
+            "Provide comprehensive responses",
+            "Ensure all recommendations are properly sourced",
+            "Cite specific parts of the uploaded document",
+            "Always search the knowledge base before assigning tasks"
+        ],
+        debug_mode=DEBUG,
+        markdown=True
+    )
+
+def document_exists(vector_db: Qdrant, doc_hash: str) -> bool:
+    """Check whether a document with this content hash is already stored in Qdrant."""
+    try:
+        points, _ = vector_db.client.scroll(
+            collection_name=COLLECTION_NAME,
+            scroll_filter=models.Filter(
+                must=[models.FieldCondition(key="meta_data.doc_sha256", match=models.MatchValue(value=doc_hash))]
+            ),
+            limit=1
+        )
+        return len(points) > 0
+    except Exception as e:
+        st.warning(f"Duplicate check failed, embedding the document again: {str(e)}")
+        return False
+
+@st.cache_resource
+def get_event_loop():
+    """
+    One long-lived event loop for all async ingestion. The cached vector DB keeps its async Qdrant and
+    embedder clients across uploads, so they must stay bound to a loop that is never closed.
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+def run_async(coro):
+    """Run a coroutine on the shared ingestion loop and wait for its result."""
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop()).result()
+
+def split_pdf(pdf_bytes: bytes, pages_per_group: int):
+    """Split a PDF into (page range, extracted text, PDF bytes) groups of at most pages_per_group pages."""
+    reader = PdfReader(io.BytesIO(pdf_bytes))
+    groups = []
+    for start in range(0, len(reader.pages), pages_per_group):
+        pages = reader.pages[start:start + pages_per_group]
+        writer = PdfWriter()
+        for page in pages:
+            writer.add_page(page)
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        text = "\n".join(page.extract_text() or "" for page in pages)
+        groups.append((f"{start + 1}-{start + len(pages)}", text, buffer.getvalue()))
+    return groups
+
+def ingest_pdf_natively(vector_db: Qdrant, pdf_bytes: bytes, name: str, doc_hash: str):
+    """
+    Embed raw PDF page groups with Gemini, preserving layout, and upsert them with page-range metadata.
+    The extracted text is stored only as payload so the agents can still quote the document.
+    """
+    from google.genai import types as genai_types  # Optional: pip install google-genai
+
+    groups = split_pdf(pdf_bytes, PDF_PAGES_PER_EMBEDDING)
+    client = vector_db.embedder.client
+    semaphore = asyncio.Semaphore(EMBEDDING_CONCURRENCY)
+
+    async def embed_group(group_bytes):
+        async with semaphore:
+            response = await client.aio.models.embed_content(
+                model=GEMINI_EMBEDDING_MODEL,
+                contents=genai_types.Part.from_bytes(data=group_bytes, mime_type="application/pdf"),
+                config=genai_types.EmbedContentConfig(
+                    output_dimensionality=EMBEDDING_DIMENSIONS,
+                    task_type="RETRIEVAL_DOCUMENT"
+                )
+            )
+            return response.embeddings[0].values
+
+    async def embed_all():
+        return await asyncio.gather(*[embed_group(group_bytes) for _, _, group_bytes in groups])
+
+    # The cached GeminiEmbedder's aio client must stay on the shared ingestion loop
+    vectors = run_async(embed_all())
+
+    # Payload mirrors agno's Qdrant layout so its search can read these points back
+    points = [
+        models.PointStruct(
+            id=hashlib.md5(f"{doc_hash}:{page_range}".encode()).hexdigest(),
+            vector=vector,
+            payload={
+                "name": name,
+                "meta_data": {"doc_sha256": doc_hash, "pages": page_range},
+                "content": text,
+                "usage": None,
+                "content_id": None,
+                "content_hash": doc_hash
+            }
+        )
+        for (page_range, text, _), vector in zip(groups, vectors)
+    ]
+    if points:
+        vector_db.client.upsert(collection_name=COLLECTION_NAME, points=points)
+
+def process_document(uploaded_file, vector_db: Qdrant, doc_hash: str):
     """
     Process document, create embeddings and store in Qdrant vector database
     """
     if not st.session_state.openai_api_key:
         raise ValueError("OpenAI API key not provided")
-        
-    os.environ['OPENAI_API_KEY'] = st.session_state.openai_api_key
-    os.environ['OPENAI_BASE_URL'] = st.session_state.openai_base_url # Set environment variable as well
     
     try:
-        # Save the uploaded file to a temporary location
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-            temp_file.write(uploaded_file.getvalue())
-            temp_file_path = temp_file.name
-        
+        # Reuse the shared Knowledge base over the vector_db
+        knowledge_base = get_knowledge(st.session_state.last_qdrant_creds, vector_db)
+
+        # Identical content was already embedded (possibly under another file name), skip ingestion
+        if is_processed(doc_hash) or document_exists(vector_db, doc_hash):
+            st.info("Document content already stored, skipping embedding.")
+            return knowledge_base
+
         st.info("Loading and processing document...")
         
-        # Create a Knowledge base with the vector_db
-        knowledge_base = Knowledge(
-            vector_db=vector_db
-        )
+        pdf_bytes = uploaded_file.getvalue()
+        if EMBEDDING_BACKEND != "gemini-native":
+            # Read and chunk the PDF straight from memory instead of round-tripping through a temp file
+            documents = PDFReader().read(io.BytesIO(pdf_bytes), name=uploaded_file.name)
+            if not documents:
+                raise ValueError("No text could be extracted from the document")
+            # Stamp the dedup key on every chunk; older agno releases ignore the insert filters
+            for document in documents:
+                document.meta_data["doc_sha256"] = doc_hash
         
         # Add the document to the knowledge base
         with st.spinner('📤 Loading document into knowledge base...'):
             try:
-                knowledge_base.add_content(path=temp_file_path)
+                if EMBEDDING_BACKEND == "gemini-native":
+                    ingest_pdf_natively(vector_db, pdf_bytes, uploaded_file.name, doc_hash)
+                else:
+                    run_async(vector_db.async_insert(content_hash=doc_hash, documents=documents))
                 st.success("✅ Document stored successfully!")
             except Exception as e:
                 st.error(f"Error loading document: {str(e)}")
                 raise
-        
-        # Clean up the temporary file
-        try:
-            os.unlink(temp_file_path)
-        except Exception:
-            pass
             
         return knowledge_base
             
@@ -100,6 +557,266 @@ def process_document(uploaded_file, vector_db: Qdrant):
         st.error(f"Document processing error: {str(e)}")
         raise Exception(f"Error processing document: {str(e)}")
 
+def ingest_with_ray(files_by_hash: dict, qdrant_url, qdrant_api_key, openai_api_key, openai_base_url) -> list:
+    """
+    Ingest several PDFs in parallel with Ray Data. Extraction/chunking, embedding and bulk upserts run as
+    separate stages so each scales across CPUs on its own. Points use the same payload layout as agno.
+    Returns the hashes of documents that were not fully stored; their partial points are removed again.
+    """
+    import ray  # Optional: pip install "ray[data]"
+    from openai import OpenAI
+    from qdrant_client import QdrantClient
+
+    def read_and_chunk(batch):
+        rows = {"name": [], "doc_hash": [], "content": [], "page": []}
+        for name, doc_hash, data in zip(batch["name"], batch["doc_hash"], batch["bytes"]):
+            for document in PDFReader().read(io.BytesIO(data), name=str(name)):
+                rows["name"].append(str(name))
+                rows["doc_hash"].append(str(doc_hash))
+                rows["content"].append(document.content.replace("\x00", "\ufffd"))
+                rows["page"].append(int(document.meta_data.get("page", 0)))
+        return rows
+
+    class Embed:
+        """Embedding stage; each Ray worker builds its client once and reuses it for every batch."""
+        def __init__(self):
+            # The client retries rate limits and transient errors with backoff
+            self.client = OpenAI(api_key=openai_api_key, base_url=openai_base_url, max_retries=5)
+
+        def embed(self, texts):
+            response = self.client.embeddings.create(
+                model="text-embedding-3-small",
+                input=texts,
+                dimensions=EMBEDDING_DIMENSIONS
+            )
+            return [data.embedding for data in response.data]
+
+        def __call__(self, batch):
+            texts = [str(content) for content in batch["content"]]
+            try:
+                embeddings = self.embed(texts)
+                embedded = [True] * len(texts)
+            except Exception:
+                # Like agno's embedders, fall back to one request per chunk so a bad chunk doesn't sink the batch
+                embeddings, embedded = [], []
+                for text in texts:
+                    try:
+                        embeddings.extend(self.embed([text]))
+                        embedded.append(True)
+                    except Exception:
+                        embeddings.append([0.0] * EMBEDDING_DIMENSIONS)
+                        embedded.append(False)
+            batch["embedding"] = embeddings
+            batch["embedded"] = embedded
+            return batch
+
+    def upsert(batch):
+        # Chunks whose embedding failed are skipped and counted per document instead of failing the whole job
+        points = [
+            models.PointStruct(
+                id=hashlib.md5(str(content).encode()).hexdigest(),
+                vector=[float(x) for x in embedding],
+                payload={
+                    "name": str(name),
+                    "meta_data": {"page": int(page), "doc_sha256": str(doc_hash)},
+                    "content": str(content),
+                    "usage": None,
+                    "content_id": None,
+                    "content_hash": str(doc_hash)
+                }
+            )
+            for name, doc_hash, content, page, embedding, embedded in zip(
+                batch["name"], batch["doc_hash"], batch["content"], batch["page"], batch["embedding"], batch["embedded"]
+            )
+            if embedded
+        ]
+        if points:
+            QdrantClient(url=qdrant_url, api_key=qdrant_api_key).upsert(collection_name=COLLECTION_NAME, points=points)
+        counts = {}
+        for doc_hash, embedded in zip(batch["doc_hash"], batch["embedded"]):
+            upserted, failed = counts.get(str(doc_hash), (0, 0))
+            counts[str(doc_hash)] = (upserted + 1, failed) if embedded else (upserted, failed + 1)
+        return {
+            "doc_hash": list(counts),
+            "upserted": [upserted for upserted, _ in counts.values()],
+            "failed": [failed for _, failed in counts.values()]
+        }
+
+    ray.init(ignore_reinit_error=True)
+    dataset = ray.data.from_items(
+        [{"name": f.name, "doc_hash": doc_hash, "bytes": f.getvalue()} for doc_hash, f in files_by_hash.items()]
+    )
+    dataset = dataset.map_batches(read_and_chunk, batch_size=1, num_cpus=1)
+    dataset = dataset.map_batches(
+        Embed, batch_size=EMBEDDING_BATCH_SIZE, num_cpus=1, concurrency=(1, EMBEDDING_CONCURRENCY)
+    )
+    dataset = dataset.map_batches(upsert, batch_size=RAY_UPSERT_BATCH_SIZE, num_cpus=1)
+
+    totals = {}
+    for row in dataset.materialize().take_all():
+        upserted, failed = totals.get(row["doc_hash"], (0, 0))
+        totals[row["doc_hash"]] = (upserted + int(row["upserted"]), failed + int(row["failed"]))
+
+    # A document counts as stored only if every chunk made it; documents without any chunks never appear in totals
+    incomplete = [
+        doc_hash for doc_hash in files_by_hash
+        if totals.get(doc_hash, (0, 0))[0] == 0 or totals[doc_hash][1] > 0
+    ]
+    for doc_hash in incomplete:
+        # Drop partial points so document_exists doesn't mistake the document for stored on the next upload
+        QdrantClient(url=qdrant_url, api_key=qdrant_api_key).delete(
+            collection_name=COLLECTION_NAME,
+            points_selector=models.FilterSelector(
+                filter=models.Filter(
+                    must=[models.FieldCondition(key="meta_data.doc_sha256", match=models.MatchValue(value=doc_hash))]
+                )
+            )
+        )
+    return incomplete
+
+def get_file_hash(uploaded_file) -> str:
+    """SHA-256 of an upload, computed once per uploaded file rather than on every rerun."""
+    if uploaded_file.file_id not in st.session_state.file_hashes:
+        st.session_state.file_hashes[uploaded_file.file_id] = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+    return st.session_state.file_hashes[uploaded_file.file_id]
+
+def process_documents(files_by_hash: dict, vector_db: Qdrant):
+    """
+    Process a batch of uploads keyed by content hash and return the knowledge base.
+    Several new files go through Ray Data when it is installed; otherwise each file is processed in turn.
+    """
+    new_files = {doc_hash: f for doc_hash, f in files_by_hash.items() if not is_processed(doc_hash)}
+    if len(new_files) > 1 and EMBEDDING_BACKEND != "gemini-native" and importlib.util.find_spec("ray"):
+        # Skip content that an earlier session already stored
+        new_files = {doc_hash: f for doc_hash, f in new_files.items() if not document_exists(vector_db, doc_hash)}
+        if new_files:
+            with st.spinner(f'📤 Loading {len(new_files)} documents into knowledge base with Ray...'):
+                try:
+                    incomplete = ingest_with_ray(
+                        new_files,
+                        st.session_state.qdrant_url,
+                        st.session_state.qdrant_api_key,
+                        st.session_state.openai_api_key,
+                        st.session_state.openai_base_url
+                    )
+                    if incomplete:
+                        # Raising keeps every hash of this batch out of processed_files; stored ones are found again next time
+                        names = ", ".join(new_files[doc_hash].name for doc_hash in incomplete)
+                        raise ValueError(f"Some chunks could not be embedded, not stored: {names}")
+                    st.success("✅ Documents stored successfully!")
+                except Exception as e:
+                    st.error(f"Error loading documents: {str(e)}")
+                    raise
+        return get_knowledge(st.session_state.last_qdrant_creds, vector_db)
+
+    knowledge_base = None
+    for doc_hash, f in files_by_hash.items():
+        knowledge_base = process_document(f, vector_db, doc_hash)
+    return knowledge_base
+
+def is_team_content(event) -> bool:
+    """Whether a streamed team event carries a delta of the team's answer (not member or lifecycle events)."""
+    return event.event == TeamRunEvent.run_content.value and isinstance(event.content, str)
+
+def get_response_text(response) -> str:
+    """Text of a finished team run, falling back to its assistant messages when content is empty."""
+    if response.content:
+        return str(response.content)
+    return "\n\n".join(
+        message.content for message in response.messages or []
+        if message.role == 'assistant' and message.content
+    )
+
+def stream_content(run_stream):
+    """
+    Yield the answer deltas of a streamed team run, for st.write_stream.
+    The run must be started with yield_run_output=True; if no deltas arrived, the final response text is yielded.
+    """
+    streamed = False
+    for event in run_stream:
+        if isinstance(event, TeamRunOutput):
+            if not streamed:
+                yield get_response_text(event)
+        elif is_team_content(event):
+            streamed = True
+            yield event.content
+
+def build_follow_up_prompt(analysis: str, agents_str: str) -> str:
+    """Build the single structured prompt asking for key points and recommendations."""
+    return f"""Based on the previous analysis:
+    {analysis}
+    
+    1. Please summarize key points in bullet format.
+       Focus on insights from: {agents_str}
+    2. Based on the analysis, what are your key recommendations and the best course of action?
+       Provide specific recommendations from: {agents_str}
+    
+    Respond with only a JSON object of the form:
+    {{"key_points": "<markdown bullet list>", "recommendations": "<markdown>"}}"""
+
+def to_markdown(value) -> str:
+    """Render a follow-up field as markdown; models often return bullet lists as JSON arrays."""
+    if isinstance(value, list):
+        return "\n".join(
+            str(item) if str(item).lstrip().startswith(("-", "*")) else f"- {item}" for item in value
+        )
+    return str(value)
+
+def parse_follow_up(text: str) -> dict:
+    """
+    Parse the combined key points / recommendations response.
+    Tolerates code fences around the JSON and raw newlines inside its strings;
+    falls back to showing the raw text as key points.
+    """
+    try:
+        data = json.loads(text[text.index("{"):text.rindex("}") + 1], strict=False)
+        return {
+            "key_points": to_markdown(data.get("key_points", "")),
+            "recommendations": to_markdown(data.get("recommendations", ""))
+        }
+    except (ValueError, AttributeError):
+        return {
+            "key_points": text,
+            "recommendations": "The response could not be split into sections; see Key Points."
+        }
+
+def normalize_query(query: str) -> str:
+    """Normalize a query for exact cache lookups."""
+    return " ".join(query.lower().split())
+
+def cosine_similarity(a, b) -> float:
+    """Cosine similarity of two embedding vectors."""
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+def embedder_identity(embedder) -> tuple:
+    """What determines an embedder's output: its class, model, dimensions and endpoint."""
+    return (type(embedder).__name__, embedder.id, embedder.dimensions, getattr(embedder, "base_url", None))
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def embed_query(query: str, embedder_key: tuple, _embedder) -> list:
+    """
+    Embed a custom query for the semantic cache; repeats of the same text skip the embedding API.
+    The embedder is not hashed, so embedder_key (see embedder_identity) keeps different embedders apart.
+    Failures raise so that they are not cached.
+    """
+    embedding = _embedder.get_embedding(query)
+    if not embedding:
+        raise ValueError("Query embedding failed")
+    return list(embedding)
+
+def find_similar_analysis(doc_hash: str, analysis_type: str, query_embedding):
+    """Return a cached analysis of the same document whose query is semantically close to this one."""
+    if not query_embedding:
+        return None
+    for (cached_hash, cached_type, _), results in st.session_state.analysis_cache.items():
+        if cached_hash != doc_hash or cached_type != analysis_type or not results["query_embedding"]:
+            continue
+        if cosine_similarity(query_embedding, results["query_embedding"]) >= SEMANTIC_CACHE_THRESHOLD:
+            return results
+    return None
+
 def main():
     st.set_page_config(page_title="Legal Document Analysis Assistant", layout="wide")
     init_session_state()
@@ -116,8 +833,6 @@ def main():
             value=st.session_state.openai_api_key if st.session_state.openai_api_key else "",
             help="Enter your OpenAI API Key"
         )
-        if openai_key:
-            st.session_state.openai_api_key = openai_key
 
         # 2. OpenAI Base URL
         base_url = st.text_input(
@@ -125,8 +840,6 @@ def main():
             value=st.session_state.openai_base_url,
             help="Enter OpenAI Base URL (leave blank or use official URL if not using a proxy)"
         )
-        if base_url:
-            st.session_state.openai_base_url = base_url
 
         st.divider() # Divider
 
@@ -137,8 +850,6 @@ def main():
             value=st.session_state.qdrant_api_key if st.session_state.qdrant_api_key else "",
             help="Enter your Qdrant API Key"
         )
-        if qdrant_key:
-            st.session_state.qdrant_api_key = qdrant_key
 
         # 4. Qdrant URL
         qdrant_url = st.text_input(
@@ -146,111 +857,38 @@ def main():
             value=st.session_state.qdrant_url if st.session_state.qdrant_url else "",
             help="Enter your Qdrant Instance URL"
         )
-        if qdrant_url:
-            st.session_state.qdrant_url = qdrant_url
 
-        if all([st.session_state.qdrant_api_key, st.session_state.qdrant_url]):
-            try:
-                if not st.session_state.vector_db:
-                    # Make sure we're initializing a QdrantClient here
-                    st.session_state.vector_db = init_qdrant()
-                    if st.session_state.vector_db:
-                        st.success("Successfully connected to Qdrant!")
-            except Exception as e:
-                st.error(f"Failed to connect to Qdrant: {str(e)}")
+        # Apply the inputs and connect to Qdrant in a single pass
+        vector_db, ready = sync_credentials(openai_key, base_url, qdrant_key, qdrant_url)
 
         st.divider()
 
-        if all([st.session_state.openai_api_key, st.session_state.vector_db]):
+        if ready:
             st.header("📄 Document Upload")
-            uploaded_file = st.file_uploader("Upload Legal Document", type=['pdf'])
+            uploaded_files = st.file_uploader("Upload Legal Documents", type=['pdf'], accept_multiple_files=True)
             
-            if uploaded_file:
-                # Check if this file has already been processed
-                if uploaded_file.name not in st.session_state.processed_files:
-                    with st.spinner("Processing document..."):
+            if uploaded_files:
+                # Key uploads by content hash so renamed duplicates are recognized
+                files_by_hash = {get_file_hash(f): f for f in uploaded_files}
+                # Identifies this set of documents in the analysis cache
+                doc_hash = hashlib.sha256("".join(sorted(files_by_hash)).encode()).hexdigest()
+                # After a browser refresh the hashes may be known while the team still needs rebuilding
+                if not all(is_processed(h) for h in files_by_hash) or not st.session_state.legal_team:
+                    with st.spinner("Processing documents..."):
                         try:
-                            # Process the document and get the knowledge base
-                            knowledge_base = process_document(uploaded_file, st.session_state.vector_db)
+                            # Process the documents and get the knowledge base
+                            knowledge_base = process_documents(files_by_hash, vector_db)
                             
                             if knowledge_base:
                                 st.session_state.knowledge_base = knowledge_base
-                                # Add the file to processed files
-                                st.session_state.processed_files.add(uploaded_file.name)
+                                # Add the files to processed files
+                                for file_hash, f in files_by_hash.items():
+                                    current_processed_files()[file_hash] = f.name
                                 
-                                # Get current Base URL
-                                current_base_url = st.session_state.openai_base_url
-
-                                # Initialize agents
-                                legal_researcher = Agent(
-                                    name="Legal Researcher",
-                                    role="Legal Research Expert",
-                                    model=OpenAIChat(id="gpt-4.1",
-                                                     api_key=st.session_state.openai_api_key, 
-                                                     base_url=current_base_url), # Use configured Base URL
-                                    tools=[DuckDuckGoTools()],
-                                    knowledge=st.session_state.knowledge_base,
-                                    search_knowledge=True,
-                                    instructions=[
-                                        "Find and cite relevant legal cases and precedents",
-                                        "Provide detailed research summaries with sources",
-                                        "Cite specific sections from the uploaded document",
-                                        "Always search the knowledge base for relevant information"
-                                    ],
-                                    debug_mode=True,
-                                    markdown=True
-                                )
-
-                                contract_analyst = Agent(
-                                    name="Contract Analyst",
-                                    role="Contract Analysis Expert",
-                                    model=OpenAIChat(id="gpt-4.1",
-                                                     api_key=st.session_state.openai_api_key, 
-                                                     base_url=current_base_url), # Use configured Base URL
-                                    knowledge=st.session_state.knowledge_base,
-                                    search_knowledge=True,
-                                    instructions=[
-                                        "Thoroughly review the contract",
-                                        "Identify key terms and potential issues",
-                                        "Cite specific clauses from the document"
-                                    ],
-                                    markdown=True
-                                )
-
-                                legal_strategist = Agent(
-                                    name="Legal Strategist", 
-                                    role="Legal Strategy Expert",
-                                    model=OpenAIChat(id="gpt-4.1",
-                                                     api_key=st.session_state.openai_api_key, 
-                                                     base_url=current_base_url), # Use configured Base URL
-                                    knowledge=st.session_state.knowledge_base,
-                                    search_knowledge=True,
-                                    instructions=[
-                                        "Develop comprehensive legal strategies",
-                                        "Provide actionable recommendations",
-                                        "Consider both risks and opportunities"
-                                    ],
-                                    markdown=True
-                                )
-
-                                # Legal Agent Team
-                                st.session_state.legal_team = Team(
-                                    name="Legal Team Lead",
-                                    model=OpenAIChat(id="gpt-4.1",
-                                                     api_key=st.session_state.openai_api_key, 
-                                                     base_url=current_base_url), # Use configured Base URL
-                                    members=[legal_researcher, contract_analyst, legal_strategist],
-                                    knowledge=st.session_state.knowledge_base,
-                                    search_knowledge=True,
-                                    instructions=[
-                                        "Coordinate analysis among team members",
-                                        "Provide comprehensive responses",
-                                        "Ensure all recommendations are properly sourced",
-                                        "Cite specific parts of the uploaded document",
-                                        "Always search the knowledge base before assigning tasks"
-                                    ],
-                                    debug_mode=True,
-                                    markdown=True
+                                # Get the (cached) legal agent team
+                                st.session_state.legal_team = get_legal_team(
+                                    st.session_state.last_qdrant_creds,
+                                    st.session_state.knowledge_base
                                 )
                                 
                                 st.success("✅ Document processing complete, team initialized!")
@@ -258,8 +896,8 @@ def main():
                         except Exception as e:
                             st.error(f"Error processing document: {str(e)}")
                 else:
-                    # File already processed, just show a message
-                    st.success("✅ Document already processed, team ready!")
+                    # Files already processed, just show a message
+                    st.success("✅ Documents already processed, team ready!")
 
             st.divider()
             st.header("🔍 Analysis Options")
@@ -277,53 +915,18 @@ def main():
             st.warning("Please configure all API credentials to continue")
 
     # Main content area
-    if not all([st.session_state.openai_api_key, st.session_state.vector_db]):
+    if not ready:
         st.info("👈 Please configure your API credentials in the sidebar to start")
-    elif not uploaded_file:
+    elif not uploaded_files:
         st.info("👈 Please upload a legal document to start analysis")
     elif st.session_state.legal_team:
-        # Create a dictionary for analysis type icons
-        analysis_icons = {
-            "Contract Review": "📑",
-            "Legal Research": "🔍",
-            "Risk Assessment": "⚠️",
-            "Compliance Check": "✅",
-            "Custom Query": "💭"
-        }
-
         # Dynamic header with icon
-        st.header(f"{analysis_icons[analysis_type]} {analysis_type}")
-  
-        analysis_configs = {
-            "Contract Review": {
-                "query": "Review this contract and identify key terms, obligations, and potential issues.",
-                "agents": ["Contract Analyst"],
-                "description": "Detailed contract analysis focusing on terms and obligations"
-            },
-            "Legal Research": {
-                "query": "Research cases and precedents relevant to this document.",
-                "agents": ["Legal Researcher"],
-                "description": "Research on relevant legal cases and precedents"
-            },
-            "Risk Assessment": {
-                "query": "Analyze potential legal risks and liabilities in this document.",
-                "agents": ["Contract Analyst", "Legal Strategist"],
-                "description": "Comprehensive risk analysis and strategic assessment"
-            },
-            "Compliance Check": {
-                "query": "Check for regulatory compliance issues in this document.",
-                "agents": ["Legal Researcher", "Contract Analyst", "Legal Strategist"],
-                "description": "Comprehensive compliance analysis"
-            },
-            "Custom Query": {
-                "query": None,
-                "agents": ["Legal Researcher", "Contract Analyst", "Legal Strategist"],
-                "description": "Custom analysis using all available agents"
-            }
-        }
+        st.header(f"{ANALYSIS_ICONS[analysis_type]} {analysis_type}")
 
-        st.info(f"📋 {analysis_configs[analysis_type]['description']}")
-        st.write(f"🤖 Active Legal AI Agents: {', '.join(analysis_configs[analysis_type]['agents'])}")  # dictionary!!
+        st.info(f"📋 {ANALYSIS_CONFIGS[analysis_type]['description']}")
+        # Joined once and reused by the display line and every prompt below
+        agents_str = ", ".join(ANALYSIS_CONFIGS[analysis_type]["agents"])
+        st.write(f"🤖 Active Legal AI Agents: {agents_str}")
 
         # Replace the existing user_query section with this:
         if analysis_type == "Custom Query":
@@ -341,80 +944,75 @@ def main():
             else:
                 with st.spinner("Analyzing document..."):
                     try:
-                        # Ensure OpenAI API key is set
-                        os.environ['OPENAI_API_KEY'] = st.session_state.openai_api_key
-                        os.environ['OPENAI_BASE_URL'] = st.session_state.openai_base_url # Ensure environment variables are also updated
-                        
                         # Combine predefined and user queries
-                        if analysis_type != "Custom Query":
-                            combined_query = f"""
-                            Using the uploaded document as reference:
-                            
-                            Primary Analysis Task: {analysis_configs[analysis_type]['query']}
-                            Focus Areas: {', '.join(analysis_configs[analysis_type]['agents'])}
-                            
-                            Please search the knowledge base and provide specific citations from the document.
-                            """
-                        else:
-                            combined_query = f"""
-                            Using the uploaded document as reference:
-                            
-                            {user_query}
-                            
-                            Please search the knowledge base and provide specific citations from the document.
-                            Focus Areas: {', '.join(analysis_configs[analysis_type]['agents'])}
-                            """
+                        config = ANALYSIS_CONFIGS[analysis_type]
+                        combined_query = config["prompt_template"].format(
+                            query=config["query"],
+                            user_query=user_query,
+                            agents=agents_str
+                        )
+
+                        # Serve repeated (or near-identical custom) analyses of the same document from cache
+                        cache_key = (doc_hash, analysis_type, normalize_query(combined_query))
+                        results = st.session_state.analysis_cache.get(cache_key)
+                        query_embedding = None
+                        if results is None and analysis_type == "Custom Query":
+                            embedder = st.session_state.vector_db.embedder
+                            try:
+                                query_embedding = embed_query(user_query, embedder_identity(embedder), embedder)
+                            except Exception:
+                                # The semantic cache is optional; a failed lookup just runs the analysis
+                                query_embedding = None
+                            results = find_similar_analysis(doc_hash, analysis_type, query_embedding)
 
-                        response: RunOutput = st.session_state.legal_team.run(combined_query)
+                        if results is not None:
+                            st.info("⚡ Returned from cache")
+
+                        legal_team = st.session_state.legal_team
                         
                         # Display results in tabs
                         tabs = st.tabs(["Analysis Results", "Key Points", "Recommendations"])
                         
                         with tabs[0]:
                             st.markdown("### Detailed Analysis")
-                            if response.content:
-                                st.markdown(response.content)
+                            if results is None:
+                                # Stream the main analysis so its first tokens show up right away
+                                analysis = st.write_stream(
+                                    stream_content(legal_team.run(combined_query, stream=True, yield_run_output=True))
+                                )
                             else:
-                                for message in response.messages:
-                                    if message.role == 'assistant' and message.content:
-                                        st.markdown(message.content)
+                                st.markdown(results["analysis"])
+                        
+                        if results is None:
+                            if not analysis:
+                                # Nothing to follow up on, and an empty answer must not be cached
+                                raise ValueError("The team returned an empty analysis")
+
+                            # One structured request covers both follow-ups, so the analysis is only sent once
+                            follow_up = parse_follow_up(get_response_text(legal_team.run(build_follow_up_prompt(analysis, agents_str))))
+
+                            results = {
+                                "analysis": analysis,
+                                "key_points": follow_up["key_points"],
+                                "recommendations": follow_up["recommendations"],
+                                "query_embedding": query_embedding
+                            }
+                            st.session_state.analysis_cache[cache_key] = results
                         
                         with tabs[1]:
                             st.markdown("### Key Points")
-                            key_points_response: RunOutput = st.session_state.legal_team.run(
-                                f"""Based on the previous analysis:    
-                                {response.content}
-                                
-                                Please summarize key points in bullet format.
-                                Focus on insights from: {', '.join(analysis_configs[analysis_type]['agents'])}"""
-                            )
-                            if key_points_response.content:
-                                st.markdown(key_points_response.content)
-                            else:
-                                for message in key_points_response.messages:
-                                    if message.role == 'assistant' and message.content:
-                                        st.markdown(message.content)
+                            st.markdown(results["key_points"])
                         
                         with tabs[2]:
                             st.markdown("### Recommendations")
-                            recommendations_response: RunOutput = st.session_state.legal_team.run(
-                                f"""Based on the previous analysis:
-                                {response.content}
-                                
-                                Based on the analysis, what are your key recommendations and the best course of action?
-                                Provide specific recommendations from: {', '.join(analysis_configs[analysis_type]['agents'])}"""
-                            )
-                            if recommendations_response.content:
-                                st.markdown(recommendations_response.content)
-                            else:
-                                for message in recommendations_response.messages:
-                                    if message.role == 'assistant' and message.content:
-                                        st.markdown(message.content)
+                            st.markdown(results["recommendations"])
 
                     except Exception as e:
                         st.error(f"Error during analysis: {str(e)}")
     else:
         st.info("Please upload a legal document to start analysis")
 
+    persist_state()
+
 if __name__ == "__main__":
     main()